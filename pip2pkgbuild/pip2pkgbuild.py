@@ -1,27 +1,24 @@
 #!/usr/bin/python
 
-# json returns unicode strings
-# which causes problems for `dict_get` in python2
-from __future__ import unicode_literals
-
-import argparse
-import fileinput
+import functools
+import gzip
+import hashlib
+import io
 import json
 import logging
 import os
 import re
+import struct
 import sys
-import tarfile
-import zipfile
+import time
 
-IS_PY2 = sys.version_info.major == 2
-if IS_PY2:
-    from cStringIO import StringIO as BytesIO
-    from urllib2 import urlopen, HTTPError
-else:
-    from io import BytesIO
-    from urllib.request import urlopen
-    from urllib.error import HTTPError
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+try:
+    import urllib3
+except ImportError:
+    urllib3 = None
 
 META = {
     'name': 'pip2pkgbuild',
@@ -29,17 +26,77 @@ META = {
     'description': 'Generate PKGBUILD file for a Python module from PyPI',
 }
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(levelname)s] : %(message)s'
-)
 LOG = logging.getLogger('log')
 
-MODULE_JSON = 'https://pypi.python.org/pypi/{name}/json'
-VERSION_MODULE_JSON = 'https://pypi.python.org/pypi/{name}/{version}/json'
+# Sent with every request, along with the request specific headers
+HTTP_HEADERS = {'User-Agent': '{name}/{version}'.format(**META)}
+
+# Keep connections alive between requests when urllib3 is available
+HTTP_POOL = urllib3.PoolManager(
+    num_pools=2, maxsize=4,
+    retries=urllib3.Retry(total=2, backoff_factor=0.2),
+) if urllib3 else None
+
+MODULE_JSON = 'https://pypi.org/pypi/{name}/json'
+VERSION_MODULE_JSON = 'https://pypi.org/pypi/{name}/{version}/json'
 
 MAINTAINER_LINE = '# Maintainer: {name} <{email}>\n'
 
+# Extensions of supported source archives, mapped to the tarfile
+# compression, or None for zip files
+ARCHIVE_EXTENSIONS = {
+    '.tar.gz': 'gz',
+    '.tar.bz2': 'bz2',
+    '.tar.xz': 'xz',
+    '.zip': None,
+}
+
+# LICENSE
+# LICENSE.txt
+# license.txt
+# LICENSES.txt
+# license
+# COPYING
+LICENSE_NAMES = frozenset(
+    ['license', 'licence', 'licenses', 'licences', 'copying'])
+LICENSE_EXTENSIONS = frozenset(['txt', 'rst', 'md'])
+
+# Characters which may appear in an SPDX license identifier
+LICENSE_TOKEN_RE = re.compile(r'[\w.+-]+')
+
+# Zip archives larger than this are spooled to disk rather than kept in memory
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+COPY_BUFFER_SIZE = 128 * 1024
+
+# Cached metadata of a given release is used without asking PyPI for this
+# many seconds. The files of a release can't change, but the latest version
+# of a module can, so lookups without a version always revalidate
+CACHE_TTL = 60 * 60
+# Cached PyPI responses not used for this many seconds are removed
+CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+# Response headers kept with a cached response, mapped to the request
+# headers which revalidate it
+CACHE_VALIDATORS = {
+    'ETag': 'If-None-Match',
+    'Last-Modified': 'If-Modified-Since',
+}
+
+# The end of central directory record of a zip file and how much of the end
+# of a remote zip file to request first when looking for it
+ZIP_EOCD = struct.Struct('<4s4H2LH')
+ZIP_EOCD_SIGNATURE = b'PK\x05\x06'
+ZIP_TAIL_SIZE = 64 * 1024
+
+# The interpreters packaged for each --python-version, and what the
+# package depends on in that mode. Split packages declare their
+# dependencies per sub package instead
+PYTHON_MODES = {
+    'python': (('python',), ('python',)),
+    'python2': (('python2',), ('python2',)),
+    'multi': (('python', 'python2'), ()),
+}
+
 SPLIT_NAME = """\
 pkgbase='{pkgbase}'
 pkgname=({pkgname})
@@ -82,12 +139,9 @@ BUILD_STATEMENTS_OLD = """\
     cd "${{srcdir}}/${{_src_folder}}{suffix}"
     {python} setup.py build"""
 
-# Note: py_pkgname is double-wrapped in braces since the string will be
-# formatted twice
 INSTALL_LICENSE = (
-    '\n'
-    'install -D -m644 {license_path}'
-    '"${{{{pkgdir}}}}/usr/share/licenses/{{py_pkgname}}/{license_name}"'
+    '    install -D -m644 {license_path} '
+    '"${{pkgdir}}/usr/share/licenses/{py_pkgname}/{license_name}"'
     )
 
 INSTALL_STATEMENT = """\
@@ -107,35 +161,36 @@ package{sub_pkgname}() {{
 """
 
 
+@functools.lru_cache(maxsize=None)
 def known_licenses():
     """
-    :rtype: list[str]
+    :rtype: tuple[str]
     """
-    args = {}
-    if IS_PY2:
-        args['openhook'] = fileinput.hook_encoded('utf-8')
-    else:
-        args['encoding'] = 'utf-8'
-    return fileinput.input(
-            files=('/usr/share/licenses/known_spdx_license_identifiers.txt'),
-            **args)
+    with open('/usr/share/licenses/known_spdx_license_identifiers.txt',
+              encoding='utf-8') as f:
+        return tuple(f.read().splitlines())
 
 
-def search_in_iter(i, p):
-    """Find the first element matching the predicate in an iterable.
+@functools.lru_cache(maxsize=None)
+def normalized_known_licenses():
+    """Pair each known license with its lower-cased form, minus ' license'.
 
-    :type i: list[T]
-    :type p: (T) -> bool
-    :rtype: T
+    :rtype: tuple[(str, str)]
     """
-    for x in i:
-        if p(x):
-            return x
-    return None
+    return tuple((removesuffix(l.lower(), ' license'), l)
+                 for l in known_licenses())
 
 
-def search_in_iter_on(proj, i, p):
-    return search_in_iter(map(proj, i), lambda x: p(proj(x)))
+@functools.lru_cache(maxsize=None)
+def known_licenses_map():
+    """Index the known licenses by their normalized form.
+
+    :rtype: dict[str, str]
+    """
+    licenses = {}
+    for normalized, original in normalized_known_licenses():
+        licenses.setdefault(normalized, original)
+    return licenses
 
 
 def iter_to_str(i):
@@ -144,36 +199,205 @@ def iter_to_str(i):
     :type i: list
     :rtype: str
     """
-    return ' '.join(map(lambda n: "'{}'".format(n), i))
+    return ' '.join(f"'{n}'" for n in i)
 
 
-def dict_get(d, key, default):
+def join_nonempty(lines):
     """
-    :type d: dict
-    :type default T
-    :rtype: T
+    :type lines: list<str>
+    :rtype: str
     """
-    value = d.get(key)
-    return value if isinstance(value, type(default)) else default
+    return '\n'.join(filter(None, lines))
 
 
-def join_nonempty(lines):
+def http_open(url, headers=None):
+    """Send a GET request and return the response as a file-like object.
+
+    :type url: str
+    :type headers: dict[str, str]
+    :raises HTTPError: if the server responds with an error status
+    """
+    headers = dict(HTTP_HEADERS, **(headers or {}))
+    if HTTP_POOL is None:
+        return urlopen(Request(url, headers=headers))
+    response = HTTP_POOL.request('GET', url, headers=headers,
+                                 preload_content=False)
+    # Redirects are followed by urllib3, like urlopen does
+    if response.status >= 300:
+        response.release_conn()
+        raise HTTPError(url, response.status, response.reason,
+                        response.headers, None)
+    return response
+
+
+def get_cache_dir():
     """
-    :type lines: list<str>
     :rtype: str
     """
-    return '\n'.join([x for x in lines if x])
+    cache_home = (os.environ.get('XDG_CACHE_HOME')
+                  or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, META['name'])
 
 
-def removesuffix(s, suffix):
+def prune_cache(max_age=CACHE_MAX_AGE):
+    """Remove cached files which have not been used for `max_age` seconds.
+
+    :type max_age: int
     """
-    :type s: str
-    :type suffix: str
-    :rtype: str
+    expires = time.time() - max_age
+    try:
+        entries = list(os.scandir(get_cache_dir()))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < expires:
+                os.remove(entry.path)
+        except OSError as e:
+            LOG.debug('Could not remove %s: %s', entry.path, e)
+
+
+def write_file_atomic(path, data):
     """
-    if s.endswith(suffix):
-        return s[:-len(suffix)]
-    return s
+    :type path: str
+    :type data: bytes
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def fetch_json(url, ttl=0):
+    """Fetch and parse a JSON document, keeping a copy of it on disk.
+
+    A cached copy younger than `ttl` seconds is used as is. Older copies
+    are revalidated with their ETag and Last-Modified date, so unchanged
+    documents are not downloaded again.
+    :type url: str
+    :type ttl: int
+    :rtype: dict
+    """
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    body_path = os.path.join(get_cache_dir(), key + '.json')
+    meta_path = os.path.join(get_cache_dir(), key + '.meta')
+
+    headers = {'Accept-Encoding': 'gzip'}
+    try:
+        age = time.time() - os.stat(body_path).st_mtime
+    except OSError:
+        age = None
+    if age is not None and age < ttl:
+        with open(body_path, 'rb') as f:
+            return json.load(f)
+    if age is not None:
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        for header, value in meta.items():
+            if header in CACHE_VALIDATORS:
+                headers[CACHE_VALIDATORS[header]] = value
+    try:
+        with http_open(url, headers=headers) as response:
+            body = response.read()
+            meta = {header: response.headers[header]
+                    for header in CACHE_VALIDATORS
+                    if header in response.headers}
+            # urllib3 decodes the body by itself, urlopen does not
+            if (HTTP_POOL is None
+                    and response.headers.get('Content-Encoding') == 'gzip'):
+                body = gzip.decompress(body)
+    except HTTPError as e:
+        # Not Modified
+        if e.code != 304:
+            raise e
+        # The cached copy is fresh again, and must not be pruned
+        for path in (body_path, meta_path):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        with open(body_path, 'rb') as f:
+            return json.load(f)
+
+    try:
+        os.makedirs(get_cache_dir(), exist_ok=True)
+        write_file_atomic(body_path, body)
+        write_file_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+    except OSError as e:
+        LOG.debug('Could not cache %s: %s', url, e)
+    # json detects the encoding of bytes by itself
+    return json.loads(body)
+
+
+def fetch_tail(url, size):
+    """Fetch the last `size` bytes of `url` with a range request.
+
+    :type url: str
+    :type size: int
+    :rtype: bytes|None
+    :return: None if the server does not support range requests
+        or rejects the requested range
+    """
+    headers = {
+        'Accept-Encoding': 'identity',
+        'Range': 'bytes=-{}'.format(size),
+    }
+    try:
+        response = http_open(url, headers=headers)
+    except HTTPError as e:
+        # Range Not Satisfiable
+        if e.code == 416:
+            return None
+        raise e
+    with response:
+        if response.status != 206:
+            return None
+        return response.read()
+
+
+def zip_directory_size(tail):
+    """Count the bytes from the central directory of a zip file to its end.
+
+    :type tail: bytes
+    :rtype: int|None
+    :return: None if `tail` holds no end of central directory record,
+        or if it belongs to a Zip64 archive
+    """
+    offset = tail.rfind(ZIP_EOCD_SIGNATURE)
+    if offset < 0 or len(tail) - offset < ZIP_EOCD.size:
+        return None
+    directory_size = ZIP_EOCD.unpack_from(tail, offset)[5]
+    if directory_size == 0xFFFFFFFF:
+        return None
+    return directory_size + len(tail) - offset
+
+
+def is_license_file(file_path):
+    """Check whether the base name of a path looks like a license file.
+
+    :type file_path: str
+    :rtype: bool
+    """
+    base = file_path.rsplit('/', 1)[-1].lower()
+    name, dot, ext = base.partition('.')
+    return name in LICENSE_NAMES and (not dot or ext in LICENSE_EXTENSIONS)
+
+
+if sys.version_info >= (3, 9):
+    removesuffix = str.removesuffix
+else:
+    def removesuffix(s, suffix):
+        """
+        :type s: str
+        :type suffix: str
+        :rtype: str
+        """
+        if suffix and s.endswith(suffix):
+            return s[:-len(suffix)]
+        return s
 
 
 class PythonModuleNotFoundError(Exception):
@@ -189,31 +413,44 @@ class ParseModuleInfoError(Exception):
 
 
 class PyModule(object):
+    __slots__ = ('module', 'name', 'pkgver', 'pkgdesc', 'url', 'license',
+                 'source', 'src_folder', 'checksums', 'license_path',
+                 'pep517')
+
     def __init__(self, json_data, find_license=False, pep517=False):
         """
         :type json_data: dict
         :type find_license: bool
         :type pep517: bool
         """
+        # Only the name and version are required, PyPI leaves out or
+        # nulls the other fields when a package does not set them
         try:
             info = json_data['info']
             self.module = info['name']
-            self.name = self.module.lower()
             self.pkgver = info['version']
-            self.pkgdesc = info['summary']
-            self.url = info['home_page']
-            self.license = self._get_license(info)
-            src_info = self._get_src_info(json_data['urls'])
-            self.source = dict_get(src_info, 'url', '')
-            self.checksums = dict_get(
-                    src_info.get('digests', {}), 'sha256', '')
-            self.license_path = None
-            self.pep517 = pep517
-            if find_license:
-                compressed_source = self._download_source(self.source)
-                self.license_path = self._find_license_path(compressed_source)
         except KeyError as e:
             raise ParseModuleInfoError(e)
+        self.name = self.module.lower()
+        self.pkgdesc = info.get('summary') or ''
+        self.url = info.get('home_page') or ''
+        self.license = self._get_license(info)
+        src_info = self._get_src_info(json_data.get('urls') or [])
+        self.source = src_info.get('url') or ''
+        filename = self.source.rpartition('/')[2]
+        self.src_folder = filename.partition(self.pkgver)[0] + self.pkgver
+        self.checksums = (
+            (src_info.get('digests') or {}).get('sha256') or '')
+        self.license_path = None
+        self.pep517 = pep517
+        if find_license:
+            compressed_source = self._download_source(self.source)
+            try:
+                self.license_path = self._find_license_path(compressed_source)
+            finally:
+                # Drop the download before generating the PKGBUILD
+                if compressed_source is not None:
+                    compressed_source.close()
 
     @staticmethod
     def _download_source(url):
@@ -226,61 +463,73 @@ class PyModule(object):
         if not url:
             LOG.warning('Given url was empty')
             return None
-        # Check to see if the file is a tarfile.
         # Unfortunately, splitext only works for files
-        # with single extensions
-        filename = os.path.basename(url)
-        # Accept .tar.gz and .tar.gz files
-        tar_match = re.match('.*\\.tar\\.(?:gz|bz2)', filename, re.I)
-        zip_match = filename.lower().endswith('.zip')
-        if not tar_match and not zip_match:
+        # with single extensions, so try the double one
+        # (.tar.gz) when the single one is unknown
+        stem, extension = os.path.splitext(os.path.basename(url).lower())
+        if extension not in ARCHIVE_EXTENSIONS:
+            extension = os.path.splitext(stem)[1] + extension
+        if extension not in ARCHIVE_EXTENSIONS:
             LOG.warning("Source url('%s') "
                         'did not have a zip or tar extension', url)
             return None
+        compression = ARCHIVE_EXTENSIONS[extension]
         try:
-            http_response = urlopen(url)
+            if compression:
+                return PyModule._open_tarball(url, compression)
+            return PyModule._open_zip(url)
         except HTTPError as e:
             LOG.error('Could not retrieve python package for '
                       'license inspection from %s with error %s', url, e)
             return None
-        if tar_match:
-            # The mode needs to be 'r|*', (any type of tarball) which
-            # tells tarfile that It should not attempt to
-            # seek() or tell() the given
-            # object since HTTPResponse doesn't support those operations
-            compressed_source = tarfile.open(fileobj=http_response, mode='r|*')
-        elif zip_match:
-            compressed_source = zipfile.ZipFile(BytesIO(http_response.read()))
-        compressed_facade = CompressedFacade(compressed_source)
-        return compressed_facade
 
     @staticmethod
-    def _search_compressed_fille(compressed_source, match):
-        """Shallow depth first sarching in compressed file
-
-        :type compressed_source: CompressedFacade
-        :type match: str -> T|None
-        :rtype: T|None
+    def _open_tarball(url, compression):
         """
-        if compressed_source is None:
-            return None
-        files = compressed_source.get_file_listing()
-
-        def depth(path):
-            """Depth of a file path.
-
-            :type path: str
-            :rtype: int
-            """
-            return path.count('/')
+        :type url: str
+        :type compression: str
+        :rtype: CompressedFacade
+        """
+        import tarfile
+
+        # Archives are compressed already
+        http_response = http_open(
+            url, headers={'Accept-Encoding': 'identity'})
+        # The mode needs to be 'r|<compression>', which tells
+        # tarfile that It should not attempt to seek() or tell()
+        # the given object since HTTPResponse doesn't support those
+        # operations. The compression is known from the extension,
+        # so there is no need to let tarfile probe for it
+        return CompressedFacade(
+            tarfile.open(fileobj=http_response, mode='r|' + compression),
+            http_response)
 
-        # Prefer matches closer to the root
-        sorted_files = sorted(files, key=depth)
-        for file_path in sorted_files:
-            matched = match(file_path)
-            if matched:
-                return matched
-        return None
+    @staticmethod
+    def _open_zip(url):
+        """
+        :type url: str
+        :rtype: CompressedFacade
+        """
+        import shutil
+        import tempfile
+        import zipfile
+
+        # Listing a zip file only needs its central directory, which is
+        # at the end of the file, so try to download just that part
+        tail = fetch_tail(url, ZIP_TAIL_SIZE)
+        if tail is not None:
+            directory_size = zip_directory_size(tail)
+            if directory_size is not None and directory_size > len(tail):
+                tail = fetch_tail(url, directory_size)
+            if directory_size is not None and tail is not None:
+                return CompressedFacade(zipfile.ZipFile(io.BytesIO(tail)))
+        # Otherwise the whole file has to be stored somewhere seekable
+        spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        with http_open(url, headers={'Accept-Encoding': 'identity'}) \
+                as http_response:
+            shutil.copyfileobj(http_response, spooled, COPY_BUFFER_SIZE)
+        spooled.seek(0)
+        return CompressedFacade(zipfile.ZipFile(spooled), spooled)
 
     def _find_license_path(self, compressed_source):
         """Determine whether the package source contains a physical license.
@@ -288,26 +537,22 @@ class PyModule(object):
         :type compressed_source: CompressedFacade
         :rtype: bool|None
         """
-        # LICENSE
-        # LICENSE.txt
-        # license.txt
-        # LICENSES.txt
-        # license
-        find_license = re.compile('.*/LICENSES?(?:\\.(txt|rst|md)|)$')
-
         def match_license(file_path):
             """
             :type file_path: str
             :rtype: str|None
             """
-            match = find_license.match(file_path, re.I)
-            if match:
-                # Remove the subfolder file_path from the match
-                # Note: path separators inside a zipfile are always '/'
-                return ''.join(match.group(0).split('/')[1:])
+            # Note: path separators inside a zipfile are always '/'
+            if '/' in file_path and is_license_file(file_path):
+                # Remove the subfolder from the file path
+                return file_path.partition('/')[2]
             return None
 
-        match = self._search_compressed_fille(compressed_source, match_license)
+        match = None
+        if compressed_source is not None:
+            # Files at the top level of the source folder are the
+            # shallowest ones match_license accepts
+            match = compressed_source.find_first(match_license, min_depth=1)
         if match is None:
             LOG.warning('Could not find license file.')
         return match
@@ -319,26 +564,31 @@ class PyModule(object):
         :type info: dict
         :rtype: str
         """
-        def find_known_licenses(p):
-            return search_in_iter_on(
-                    lambda l: removesuffix(l.lower(), ' license'),
-                    known_licenses(), p)
-
-        license_ = find_known_licenses(
-            lambda recg: recg == dict_get(info, 'license', ''))
+        known = known_licenses_map()
+        license_ = known.get(
+            removesuffix((info.get('license') or '').lower(), ' license'))
 
         if license_ is None:
-            license_str = search_in_iter(
-                dict_get(info, 'classifiers', []),
-                lambda clsf: clsf.startswith('License'))
+            license_str = next(
+                (clsf for clsf in info.get('classifiers') or ()
+                 if clsf.startswith('License')),
+                None)
 
             if license_str is None:
                 license_ = 'unknown'
             else:
                 license_str = license_str.split('::')[-1].strip()
-                license_ = find_known_licenses(
-                    lambda recg: recg in license_str)
-                if license_ is None:
+                # SPDX identifiers never contain spaces, so look up each
+                # word of the classifier instead of scanning for substrings.
+                # The longest known word is the most specific one, e.g.
+                # 'MIT-0' in 'MIT No Attribution License (MIT-0)'
+                matches = [
+                    token for token in
+                    LICENSE_TOKEN_RE.findall(license_str.lower())
+                    if token in known]
+                if matches:
+                    license_ = known[max(matches, key=len)]
+                else:
                     license_ = 'custom:{}'.format(license_str)
         return license_
 
@@ -353,16 +603,16 @@ class PyModule(object):
             LOG.warning('Add it manually and regenerate checksum')
             return {}
 
-        info = search_in_iter(
-                urls,
-                lambda u: dict_get(u, 'url', '').endswith('.tar.gz'))
-        if info is None:
-            info = search_in_iter(
-                    urls,
-                    lambda u: not dict_get(u, 'url', '').endswith('.whl'))
-        if info is None:
-            info = urls[0]
-        return info
+        # Prefer a .tar.gz, then anything other than a wheel
+        # and stop at the first .tar.gz, nothing can beat it
+        non_wheel = None
+        for u in urls:
+            url = u.get('url') or ''
+            if url.endswith('.tar.gz'):
+                return u
+            if non_wheel is None and not url.endswith('.whl'):
+                non_wheel = u
+        return non_wheel or urls[0]
 
     def _get_source(self, url):
         """
@@ -375,14 +625,22 @@ class PyModule(object):
 
 class CompressedFacade(object):
     """Unify the `tarfile` and `zipfile` interface."""
+    __slots__ = ('obj', 'fileobj', 'compressed_type')
+
     ZIPFILE = 1
     TARFILE = 2
 
-    def __init__(self, obj):
+    def __init__(self, obj, fileobj=None):
         """
-        :type obj: tarfile.TarFile | tarfile.ZipFile
+        :param fileobj: the file `obj` reads from, which is closed with it
+        :type obj: tarfile.TarFile | zipfile.ZipFile
+        :type fileobj: io.IOBase | None
         """
+        import tarfile
+        import zipfile
+
         self.obj = obj
+        self.fileobj = fileobj
         if isinstance(obj, tarfile.TarFile):
             self.compressed_type = CompressedFacade.TARFILE
         elif isinstance(obj, zipfile.ZipFile):
@@ -390,24 +648,75 @@ class CompressedFacade(object):
         else:
             raise ValueError('Given object(%s) not a tar or zipfile', obj)
 
-    def get_file_listing(self):
-        """Return the files present inside of the archive.
+    def iter_file_listing(self):
+        """Yield the files present inside of the archive.
 
-        Note tarfile lists the base directory in getnames while
-        zipfile does not it its method.
+        Note tarfile lists the base directory in its members while
+        zipfile does not in its name list.
 
-        :rtype: list[str]
+        :rtype: collections.Iterator[str]
         """
         if self.compressed_type == CompressedFacade.TARFILE:
-            return [tar_info.name for
-                    tar_info in self.obj.getmembers() if not tar_info.isdir()]
+            tar_info = self.obj.next()
+            while tar_info is not None:
+                if not tar_info.isdir():
+                    yield tar_info.name
+                # Streamed archives keep every member read so far,
+                # which is of no use here
+                self.obj.members = []
+                tar_info = self.obj.next()
         else:
-            # Remove directories from list
-            return [name for
-                    name in self.obj.namelist() if not name.endswith('/')]
+            for zip_info in self.obj.infolist():
+                if not zip_info.is_dir():
+                    yield zip_info.filename
+
+    def close(self):
+        """Close the archive and the file it was read from.
+
+        Neither tarfile nor zipfile close a file object they were given.
+        """
+        self.obj.close()
+        if self.fileobj is not None:
+            self.fileobj.close()
+
+    def find_first(self, match, min_depth=0):
+        """Shallow depth first searching in the archive.
+
+        :param min_depth: the depth of the shallowest path `match` accepts,
+            the search stops as soon as a match this shallow is found
+        :type match: str -> T|None
+        :type min_depth: int
+        :rtype: T|None
+        """
+        def depth(path):
+            """Depth of a file path.
+
+            :type path: str
+            :rtype: int
+            """
+            return path.count('/')
+
+        # Prefer matches closer to the root, keeping the first of equally
+        # deep ones. Matches at `min_depth` can't be beaten, so stop
+        # reading the archive once one of them is found
+        best = None
+        best_depth = None
+        for file_path in self.iter_file_listing():
+            file_depth = depth(file_path)
+            if best is not None and file_depth >= best_depth:
+                continue
+            matched = match(file_path)
+            if matched:
+                if file_depth <= min_depth:
+                    return matched
+                best, best_depth = matched, file_depth
+        return best
 
 
 class Packager(object):
+    __slots__ = ('module', 'name', 'email', 'pep517', 'python', 'py_pkgname',
+                 'py2_pkgname', 'depends', 'py2_depends', 'py3_depends',
+                 'mkdepends', 'pkgname', 'pkgbase')
 
     def __init__(self, module, python=None, depends=None, py2_depends=None,
                  py3_depends=None, mkdepends=None, pkgbase=None, pkgname=None,
@@ -430,9 +739,8 @@ class Packager(object):
         self.email = email
         self.pep517 = module.pep517
 
-        self.python = 'python2' if IS_PY2 else 'python'
-        if python in ['python', 'python2', 'multi']:
-            self.python = python
+        self.python = python if python in PYTHON_MODES else 'python'
+        interpreters, depends_on = PYTHON_MODES[self.python]
 
         python_pkgname = 'python-{}'.format(module.name)
         python2_pkgname = 'python2-{}'.format(module.name)
@@ -440,24 +748,19 @@ class Packager(object):
         self.py_pkgname = pkgname or python_pkgname
         self.py2_pkgname = py2_pkgname or python2_pkgname
 
-        self.depends = []
+        pkgnames = {'python': self.py_pkgname, 'python2': self.py2_pkgname}
+        self.pkgname = [pkgnames[py] for py in interpreters]
+
+        self.depends = list(depends_on)
         self.py2_depends = ['python2']
         self.py3_depends = ['python']
-        self.mkdepends = []
+        self.mkdepends = self._get_mkdepends()
 
         if self.python == 'multi':
-            self.pkgname = [self.py_pkgname, self.py2_pkgname]
             if py2_depends:
                 self.py2_depends += py2_depends
             if py3_depends:
                 self.py3_depends += py3_depends
-        elif self.python == 'python2':
-            self.pkgname = [self.py2_pkgname]
-            self.depends += ['python2']
-        elif self.python == 'python':
-            self.pkgname = [self.py_pkgname]
-            self.depends += ['python']
-        self.mkdepends += self._get_mkdepends()
 
         if depends:
             self.depends += depends
@@ -473,17 +776,8 @@ class Packager(object):
             modules = ['build', 'installer', 'wheel']
         else:
             modules = ['setuptools']
-        if self.python == 'multi':
-            versions = ['', '2']
-        elif self.python == 'python2':
-            versions = ['2']
-        elif self.python == 'python':
-            versions = ['']
-        mkdepends = []
-        for m in modules:
-            for v in versions:
-                mkdepends.append('python' + v + '-' + m)
-        return mkdepends
+        interpreters = PYTHON_MODES[self.python][0]
+        return [py + '-' + m for m in modules for py in interpreters]
 
     def _gen_build_func(self, python):
         def gen_statements(py):
@@ -497,13 +791,9 @@ class Packager(object):
                 python=py
             )
 
-        if python == 'multi':
-            pylist = ['python', 'python2']
-        else:
-            pylist = [python]
-
         return BUILD_FUNC.format(
-            statements='\n\n'.join(map(gen_statements, pylist))
+            statements='\n\n'.join(
+                map(gen_statements, PYTHON_MODES[python][0]))
         )
 
     def generate(self):
@@ -517,9 +807,6 @@ class Packager(object):
                 name=self.name, email=self.email)
             pkgbuild.append(maintainer_line)
 
-        pkg = self.module.source.split('/')[-1]
-        src_folder = pkg.split(self.module.pkgver)[0] + self.module.pkgver
-
         if self.python == 'multi':
             pkgbuild.append(SPLIT_NAME.format(
                 pkgbase=self.pkgbase,
@@ -530,7 +817,7 @@ class Packager(object):
 
         headers = HEADERS.format(
             module=self.module.module,
-            src_folder=src_folder,
+            src_folder=self.module.src_folder,
             pkgver=self.module.pkgver,
             pkgdesc=self.module.pkgdesc,
             url=self.module.url,
@@ -544,20 +831,26 @@ class Packager(object):
         pkgbuild.append(headers)
 
         install = INSTALL_STATEMENT if self.pep517 else INSTALL_STATEMENT_OLD
-        if self.module.license_path:
-            license_path = self.module.license_path
-            license_command = INSTALL_LICENSE.format(
+        license_path = self.module.license_path
+
+        def install_license(py_pkgname):
+            """
+            :type py_pkgname: str
+            :rtype: str
+            """
+            if not license_path:
+                return ''
+            return INSTALL_LICENSE.format(
                 license_path=license_path,
-                license_name=os.path.basename(license_path)
+                license_name=os.path.basename(license_path),
+                py_pkgname=py_pkgname
             )
-        else:
-            license_command = ''
 
         build_fun = self._gen_build_func(self.python)
 
         if self.python == 'multi':
             packaging_steps = join_nonempty([
-                license_command.format(py_pkgname=self.py_pkgname),
+                install_license(self.py_pkgname),
                 install.format(python='python')
             ])
             package_func = PACKAGE_FUNC.format(
@@ -569,7 +862,7 @@ class Packager(object):
             )
 
             py2_packaging_steps = join_nonempty([
-                license_command.format(py_pkgname=self.py2_pkgname),
+                install_license(self.py2_pkgname),
                 install.format(python='python2')
             ])
             py2_package_func = PACKAGE_FUNC.format(
@@ -586,7 +879,7 @@ class Packager(object):
                          py2_package_func]
         else:
             packaging_steps = join_nonempty([
-                license_command.format(py_pkgname=self.pkgname[0]),
+                install_license(self.pkgname[0]),
                 install.format(python=self.python)
             ])
             package_func = PACKAGE_FUNC.format(
@@ -608,29 +901,31 @@ def fetch_pymodule(name, version, find_license=False, pep517=False):
     :type pep517: bool
     :rtype: PyModule
     """
-    def fetch_json(url):
-        return json.loads(urlopen(url).read().decode('utf-8'))
-
-    try:
+    if version:
+        url = VERSION_MODULE_JSON.format(name=name, version=version)
+        ttl = CACHE_TTL
+    else:
         url = MODULE_JSON.format(name=name)
-        info = fetch_json(url)
-        if version:
-            if info['releases'].get(version) is None:
-                raise PythonModuleVersionNotFoundError(
-                        '{} {}'.format(name, version))
-            else:
-                url = VERSION_MODULE_JSON.format(name=name, version=version)
-                info = fetch_json(url)
-
+        ttl = 0
+    try:
+        info = fetch_json(url, ttl)
     except HTTPError as e:
-        if e.code == 404:
-            raise PythonModuleNotFoundError('{}'.format(name))
-        else:
+        if e.code != 404:
             raise e
+        if version:
+            raise PythonModuleVersionNotFoundError(
+                    '{} {}'.format(name, version))
+        raise PythonModuleNotFoundError('{}'.format(name))
     return PyModule(info, find_license, pep517)
 
 
-def main():
+@functools.lru_cache(maxsize=None)
+def build_parser():
+    """
+    :rtype: argparse.ArgumentParser
+    """
+    import argparse
+
     argparser = argparse.ArgumentParser(prog=META['name'],
                                         description=META['description'])
     argparser.add_argument(
@@ -642,7 +937,7 @@ def main():
             help='Use the specified version of the Python module')
     argparser.add_argument(
             '-p', '--python-version',
-            choices=['python', 'python2', 'multi'],
+            choices=list(PYTHON_MODES),
             dest='python',
             help='The Python version on which the PKGBUILD bases')
     argparser.add_argument(
@@ -701,22 +996,41 @@ def main():
             '--email', dest='email', default=None,
             help='Email for the package maintainer line')
     argparser.add_argument(
-            '--pep517', dest='pep517', action='store_true',
-            default=False if IS_PY2 else True,
-            help='Prefer PEP517 based installation method if supported')
+            '--pep517', dest='pep517', action='store_true', default=None,
+            help='Prefer PEP517 based installation method if supported. '
+            + 'Default for Python 3 only packages')
+    argparser.add_argument(
+            '--no-pep517', dest='pep517', action='store_false',
+            help='Use the setup.py based installation method. '
+            + 'Default when a Python 2 package is generated')
+    return argparser
+
+
+def main(argv=None):
+    """
+    :param argv: the command line arguments, sys.argv[1:] by default
+    :type argv: list[str]|None
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(levelname)s] : %(message)s'
+    )
 
-    args = argparser.parse_args()
+    args = build_parser().parse_args(argv)
 
     if bool(args.email) != bool(args.name):
         LOG.error('Must supply either both email and name or neither.')
         sys.exit(1)
-    if args.pep517 and (
-            (args.python is None and IS_PY2)
-            or args.python == 'multi' or args.python == 'python2'
-    ):
-        LOG.error('PEP517 based installation supports Python 3 packages only.')
+    has_python2 = 'python2' in PYTHON_MODES[args.python or 'python'][0]
+    if args.pep517 is None:
+        args.pep517 = not has_python2
+    elif args.pep517 and has_python2:
+        LOG.error('PEP517 based installation supports Python 3 packages only, '
+                  'pass --no-pep517 to build Python 2 packages.')
         sys.exit(1)
 
+    prune_cache()
+
     try:
         module = fetch_pymodule(args.module, args.module_version,
                                 args.find_license,
@@ -754,10 +1068,17 @@ def main():
     if args.print_out:
         sys.stdout.write(pkgbuild)
     else:
-        with open('PKGBUILD', 'w') as f:
-            f.write(pkgbuild)
-            LOG.info('Successfully generated PKGBUILD under {}'
-                     .format(os.getcwd()))
+        # The whole file is in memory already, no need for buffering
+        data = memoryview(pkgbuild.encode('utf-8'))
+        fd = os.open('PKGBUILD', os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                     0o666)
+        try:
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+        LOG.info('Successfully generated PKGBUILD under {}'
+                 .format(os.getcwd()))
 
 
 if __name__ == '__main__':
@@ -1,28 +1,21 @@
-import io
+import ast
 import os
-import sys
 
 from setuptools import find_packages, setup
 
 here = os.path.abspath(os.path.dirname(__file__))
-IS_PY2 = sys.version_info.major == 2
-if IS_PY2:
-    import imp
-    META = imp.load_source(
-                '',
-                os.path.join(here, 'pip2pkgbuild/pip2pkgbuild.py')
-            ).META
-else:
-    import importlib.util
-    spec = importlib.util.spec_from_file_location(
-            'pip2pkgbuild',
-            'pip2pkgbuild/pip2pkgbuild.py'
-           )
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)
-    META = module.META
 
-with io.open(os.path.join(here, 'README.md'), encoding='utf-8') as f:
+# Read META without running the module, which would pull in its imports
+with open(os.path.join(here, 'pip2pkgbuild', 'pip2pkgbuild.py'),
+          encoding='utf-8') as f:
+    META = next(
+        ast.literal_eval(node.value)
+        for node in ast.parse(f.read()).body
+        if isinstance(node, ast.Assign)
+        and any(getattr(t, 'id', None) == 'META' for t in node.targets)
+    )
+
+with open(os.path.join(here, 'README.md'), encoding='utf-8') as f:
     long_description = os.linesep + f.read()
 
 setup(
@@ -48,14 +41,8 @@ setup(
         'Natural Language :: English',
         'Operating System :: OS Independent',
 
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
 
         'Topic :: Software Development :: Build Tools',
         'Topic :: Software Development :: Code Generators',
@@ -64,6 +51,7 @@ setup(
     ],
 
     keywords='Packaging ArchLinux PKGBUILD',
+    python_requires='>=3.6',
     packages=find_packages(),
     entry_points={
         'console_scripts': [
@@ -0,0 +1,351 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from urllib.error import HTTPError
+
+from pip2pkgbuild import pip2pkgbuild
+
+
+def make_zip(names):
+    """
+    :type names: list[str]
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name in names:
+            zf.writestr(name, b'text')
+    return buffer.getvalue()
+
+
+def make_tarball(names):
+    """
+    :type names: list[str]
+    :rtype: bytes
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tf:
+        for name in names:
+            info = tarfile.TarInfo(name)
+            info.size = 4
+            tf.addfile(info, io.BytesIO(b'text'))
+    return buffer.getvalue()
+
+
+KNOWN_LICENSES = ('MIT', 'MIT-0', 'Apache-2.0', 'BSD-3-Clause',
+                  'GPL-3.0-or-later')
+
+
+def use_known_licenses(test_case, licenses=KNOWN_LICENSES):
+    """Replace the system list of known licenses for the length of a test.
+
+    :type test_case: unittest.TestCase
+    :type licenses: tuple[str]
+    """
+    cached = (pip2pkgbuild.known_licenses,
+              pip2pkgbuild.normalized_known_licenses,
+              pip2pkgbuild.known_licenses_map)
+
+    def clear_caches():
+        for func in cached:
+            func.cache_clear()
+
+    clear_caches()
+    test_case.addCleanup(clear_caches)
+    patcher = mock.patch.object(
+        pip2pkgbuild, 'known_licenses', return_value=licenses)
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
+
+
+def match_license(file_path):
+    return file_path if pip2pkgbuild.is_license_file(file_path) else None
+
+
+class FakeResponse(io.BytesIO):
+
+    def __init__(self, body, headers=None):
+        super().__init__(body)
+        self.headers = headers or {}
+
+
+class TestIsLicenseFile(unittest.TestCase):
+
+    def test_matches_at_any_depth(self):
+        self.assertTrue(pip2pkgbuild.is_license_file('pkg/license.txt'))
+        self.assertTrue(pip2pkgbuild.is_license_file('pkg/sub/license.txt'))
+
+    def test_matches_known_names_and_extensions(self):
+        for path in ('pkg/LICENSE', 'pkg/LICENSE.md', 'pkg/Licence.rst',
+                     'pkg/LICENSES.txt', 'pkg/COPYING', 'pkg/copying.txt'):
+            self.assertTrue(pip2pkgbuild.is_license_file(path), path)
+
+    def test_rejects_other_files(self):
+        for path in ('pkg/LICENSE-MIT', 'pkg/LICENSE.py', 'pkg/license/x.py',
+                     'pkg/COPYING.LESSER', 'pkg/setup.py'):
+            self.assertFalse(pip2pkgbuild.is_license_file(path), path)
+
+
+class TestGetLicense(unittest.TestCase):
+
+    def setUp(self):
+        use_known_licenses(self)
+
+    def get_license(self, license_=None, classifiers=None):
+        """
+        :type license_: str|None
+        :type classifiers: list[str]|None
+        :rtype: str
+        """
+        return pip2pkgbuild.PyModule._get_license(
+            {'license': license_, 'classifiers': classifiers})
+
+    def test_declared_license(self):
+        self.assertEqual(self.get_license('MIT'), 'MIT')
+        self.assertEqual(self.get_license('apache-2.0'), 'Apache-2.0')
+        self.assertEqual(self.get_license('MIT License'), 'MIT')
+
+    def test_classifier(self):
+        self.assertEqual(
+            self.get_license(classifiers=[
+                'Programming Language :: Python',
+                'License :: OSI Approved :: MIT License']),
+            'MIT')
+
+    def test_classifier_prefers_most_specific_identifier(self):
+        self.assertEqual(
+            self.get_license(classifiers=[
+                'License :: OSI Approved :: '
+                'MIT No Attribution License (MIT-0)']),
+            'MIT-0')
+
+    def test_unknown_declared_license_falls_back_to_classifier(self):
+        self.assertEqual(
+            self.get_license('Some text', [
+                'License :: OSI Approved :: BSD-3-Clause']),
+            'BSD-3-Clause')
+
+    def test_unknown_classifier(self):
+        self.assertEqual(
+            self.get_license(classifiers=[
+                'License :: OSI Approved :: Python Software Foundation '
+                'License']),
+            'custom:Python Software Foundation License')
+
+    def test_no_license(self):
+        self.assertEqual(self.get_license(), 'unknown')
+
+
+class TestZipDirectorySize(unittest.TestCase):
+
+    def test_whole_file(self):
+        data = make_zip(['pkg/LICENSE', 'pkg/setup.py'])
+        size = pip2pkgbuild.zip_directory_size(data)
+        with zipfile.ZipFile(io.BytesIO(data[-size:])) as zf:
+            self.assertEqual(zf.namelist(), ['pkg/LICENSE', 'pkg/setup.py'])
+
+    def test_tail_shorter_than_directory(self):
+        data = make_zip(['pkg/file{}.py'.format(i) for i in range(100)])
+        tail = data[-100:]
+        self.assertGreater(pip2pkgbuild.zip_directory_size(tail), len(tail))
+
+    def test_no_end_of_central_directory(self):
+        self.assertIsNone(pip2pkgbuild.zip_directory_size(b'not a zip'))
+        data = make_zip(['pkg/LICENSE'])
+        self.assertIsNone(pip2pkgbuild.zip_directory_size(data[:-1]))
+
+
+class TestFindFirst(unittest.TestCase):
+
+    NAMES = [
+        'pkg-1.0/src/pkg/LICENSE',
+        'pkg-1.0/docs/license.txt',
+        'pkg-1.0/setup.py',
+        'pkg-1.0/LICENSE.md',
+        'pkg-1.0/COPYING',
+    ]
+
+    def test_zip_prefers_shallowest_match(self):
+        facade = pip2pkgbuild.CompressedFacade(
+            zipfile.ZipFile(io.BytesIO(make_zip(self.NAMES))))
+        self.assertEqual(facade.find_first(match_license),
+                         'pkg-1.0/LICENSE.md')
+
+    def test_tarball_prefers_shallowest_match(self):
+        facade = pip2pkgbuild.CompressedFacade(tarfile.open(
+            fileobj=io.BytesIO(make_tarball(self.NAMES)), mode='r|gz'))
+        self.assertEqual(facade.find_first(match_license),
+                         'pkg-1.0/LICENSE.md')
+
+    def test_keeps_first_of_equally_deep_matches(self):
+        names = ['pkg-1.0/a/LICENSE', 'pkg-1.0/b/COPYING']
+        facade = pip2pkgbuild.CompressedFacade(
+            zipfile.ZipFile(io.BytesIO(make_zip(names))))
+        self.assertEqual(facade.find_first(match_license),
+                         'pkg-1.0/a/LICENSE')
+
+    def test_stops_at_top_level_match(self):
+        names = ['pkg-1.0/LICENSE'] + [
+            'pkg-1.0/src/file{}.py'.format(i) for i in range(10)]
+        facade = pip2pkgbuild.CompressedFacade(
+            zipfile.ZipFile(io.BytesIO(make_zip(names))))
+        seen = []
+
+        def match(file_path):
+            seen.append(file_path)
+            return match_license(file_path)
+
+        self.assertEqual(facade.find_first(match, min_depth=1),
+                         'pkg-1.0/LICENSE')
+        self.assertEqual(seen, ['pkg-1.0/LICENSE'])
+
+    def test_keeps_searching_above_min_depth(self):
+        names = ['pkg-1.0/LICENSE', 'LICENSE']
+        facade = pip2pkgbuild.CompressedFacade(
+            zipfile.ZipFile(io.BytesIO(make_zip(names))))
+        self.assertEqual(facade.find_first(match_license), 'LICENSE')
+
+    def test_no_match(self):
+        facade = pip2pkgbuild.CompressedFacade(
+            zipfile.ZipFile(io.BytesIO(make_zip(['pkg-1.0/setup.py']))))
+        self.assertIsNone(facade.find_first(match_license))
+
+
+class TestPackager(unittest.TestCase):
+
+    JSON_DATA = {
+        'info': {'name': 'Pkg', 'version': '1.0'},
+        'urls': [{'url': 'https://files/Pkg-1.0.tar.gz'}],
+    }
+
+    def setUp(self):
+        use_known_licenses(self)
+
+    def test_pep517_accepts_any_truth_value(self):
+        for pep517, build in ((None, 'python setup.py build'),
+                              (0, 'python setup.py build'),
+                              (1, 'python -m build --wheel')):
+            module = pip2pkgbuild.PyModule(self.JSON_DATA, pep517=pep517)
+            pkgbuild = pip2pkgbuild.Packager(module).generate()
+            self.assertIn(build, pkgbuild)
+
+
+class TestMain(unittest.TestCase):
+
+    def setUp(self):
+        use_known_licenses(self)
+
+    def pep517_for(self, argv):
+        """Run main() and return the pep517 value it fetched the module with.
+
+        :type argv: list[str]
+        :rtype: bool
+        """
+        module = pip2pkgbuild.PyModule(TestPackager.JSON_DATA)
+        with mock.patch.object(pip2pkgbuild, 'prune_cache'), \
+                mock.patch.object(pip2pkgbuild, 'fetch_pymodule',
+                                  return_value=module) as fetch_pymodule, \
+                mock.patch('sys.stdout', io.StringIO()):
+            pip2pkgbuild.main(['pkg', '--print-out'] + argv)
+        return fetch_pymodule.call_args[0][3]
+
+    def test_pep517_by_default_for_python3(self):
+        self.assertIs(self.pep517_for([]), True)
+        self.assertIs(self.pep517_for(['-p', 'python']), True)
+
+    def test_python2_modes_default_to_setup_py(self):
+        self.assertIs(self.pep517_for(['-p', 'python2']), False)
+        self.assertIs(self.pep517_for(['-p', 'multi']), False)
+
+    def test_no_pep517(self):
+        self.assertIs(self.pep517_for(['--no-pep517']), False)
+
+    def test_pep517_rejected_for_python2(self):
+        with self.assertRaises(SystemExit) as cm:
+            self.pep517_for(['-p', 'python2', '--pep517'])
+        self.assertEqual(cm.exception.code, 1)
+
+
+class TestFetchJson(unittest.TestCase):
+
+    URL = 'https://pypi.org/pypi/pkg/json'
+
+    def setUp(self):
+        cache_home = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_home.cleanup)
+        patcher = mock.patch.dict(
+            os.environ, {'XDG_CACHE_HOME': cache_home.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # fetch_pymodule builds a PyModule, which looks up the license
+        use_known_licenses(self)
+
+    def test_revalidates_with_etag(self):
+        body = json.dumps({'info': {'name': 'pkg'}}).encode('utf-8')
+        responses = [
+            FakeResponse(body, {'ETag': '"v1"'}),
+            HTTPError(self.URL, 304, 'Not Modified', {}, None),
+        ]
+        calls = []
+
+        def http_open(url, headers=None):
+            calls.append(headers)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch.object(pip2pkgbuild, 'http_open', http_open):
+            first = pip2pkgbuild.fetch_json(self.URL)
+            second = pip2pkgbuild.fetch_json(self.URL)
+
+        self.assertEqual(first, {'info': {'name': 'pkg'}})
+        self.assertEqual(second, first)
+        self.assertNotIn('If-None-Match', calls[0])
+        self.assertEqual(calls[1]['If-None-Match'], '"v1"')
+
+    def test_fresh_copy_is_used_within_ttl(self):
+        body = json.dumps({'info': {'name': 'pkg'}}).encode('utf-8')
+        calls = []
+
+        def http_open(url, headers=None):
+            calls.append(headers)
+            return FakeResponse(body)
+
+        with mock.patch.object(pip2pkgbuild, 'http_open', http_open):
+            first = pip2pkgbuild.fetch_json(self.URL, ttl=3600)
+            second = pip2pkgbuild.fetch_json(self.URL, ttl=3600)
+
+        self.assertEqual(second, first)
+        self.assertEqual(len(calls), 1)
+
+    def test_fetch_pymodule_revalidates_latest_version(self):
+        with mock.patch.object(pip2pkgbuild, 'fetch_json') as fetch_json:
+            fetch_json.return_value = {
+                'info': {'name': 'pkg', 'version': '1.0'}, 'urls': []}
+            pip2pkgbuild.fetch_pymodule('pkg', '')
+            pip2pkgbuild.fetch_pymodule('pkg', '1.0')
+
+        self.assertEqual(fetch_json.call_args_list, [
+            mock.call(pip2pkgbuild.MODULE_JSON.format(name='pkg'), 0),
+            mock.call(pip2pkgbuild.VERSION_MODULE_JSON.format(
+                name='pkg', version='1.0'), pip2pkgbuild.CACHE_TTL),
+        ])
+
+    def test_errors_are_not_cached(self):
+        def http_open(url, headers=None):
+            raise HTTPError(url, 404, 'Not Found', {}, None)
+
+        with mock.patch.object(pip2pkgbuild, 'http_open', http_open):
+            with self.assertRaises(HTTPError):
+                pip2pkgbuild.fetch_json(self.URL)
+        self.assertFalse(os.path.exists(pip2pkgbuild.get_cache_dir()))
+
+
+if __name__ == '__main__':
+    unittest.main()